@@ -47,7 +47,7 @@ class DeadlinesCog(commands.Cog):
             print(f"❌ Could not fetch message: {e}")
             return
 
-        result = extract_next_day_deadlines(msg.content, tomorrow)
+        result = await extract_next_day_deadlines(msg.content, tomorrow)
         print(f"🔍 GPT result for {tomorrow}: {result}")
 
         if result == "NO_DEADLINE_FOUND":
@@ -1,12 +1,19 @@
+import bisect
+import hashlib
 import json
+import math
 import os
-from typing import List
+import re
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Sequence, Set, Tuple
 from urllib.parse import quote
 
 import discord
+import httpx
 from discord import app_commands
 from discord.ext import commands
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 # --------------------------
 # Config
@@ -17,44 +24,127 @@ SHARE_BASE_URL = os.getenv(
 )
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 MAX_CANDIDATES_FOR_LLM = int(os.getenv("MAX_CANDIDATES_FOR_LLM", "350"))
+# Best lexical matches shown to the LLM; when nothing matches lexically it gets
+# the first MAX_CANDIDATES_FOR_LLM files of the year instead
+LLM_TOP_K = int(os.getenv("LLM_TOP_K", "10"))
+# Skip the LLM when the n-th hit outscores the next one by this factor ("inf" = never)
+LLM_SKIP_RATIO = float(os.getenv("LLM_SKIP_RATIO", "2.0"))
+# Completions remembered per (query, candidate list, n); answers are deterministic
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+
+YEAR_PREFIXES = {1: "1ere/", 2: "2eme/", 3: "3eme/"}
+
+# Separators that split a lowercased path into index tokens
+TOKEN_SPLIT_RE = re.compile(r"[\s/_\-.]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
 
 
 # --------------------------
 # Helpers
 # --------------------------
-def load_files() -> List[str]:
+def load_files() -> Tuple[str, ...]:
+    # extract_files_only.py already writes the list sorted and deduplicated
     with open(FILES_JSON, "r", encoding="utf-8") as f:
-        files = json.load(f)
-    return sorted(set(files))
+        return tuple(json.load(f))
+
+
+@lru_cache(maxsize=1024)
+def needle_pattern(needle: str) -> "re.Pattern[str]":
+    # Compiled once per query token; repeated queries reuse it
+    return re.compile(re.escape(needle))
+
+
+class JoinedLines:
+    """Strings joined by newlines, so a needle is found in all of them in one C scan."""
+
+    def __init__(self, lines: Sequence[str]):
+        self.blob = "\n".join(lines)
+        self.starts = []
+        offset = 0
+        for line in lines:
+            self.starts.append(offset)
+            offset += len(line) + 1
+
+    def lines_containing(self, needle: str) -> Set[int]:
+        """Indexes of the lines containing `needle` (which must not hold a newline)."""
+        return {
+            bisect.bisect_right(self.starts, m.start()) - 1
+            for m in needle_pattern(needle).finditer(self.blob)
+        }
+
+
+class PathIndex:
+    """Lowercased paths plus a token -> path ids inverted index, built once."""
+
+    def __init__(self, paths: Tuple[str, ...]):
+        self.paths = paths
+        self.lower = [p.lower() for p in paths]
+        self.joined = JoinedLines(self.lower)
+        self.tokens = [[t for t in TOKEN_SPLIT_RE.split(l) if t] for l in self.lower]
+        self.avg_len = sum(map(len, self.tokens)) / max(len(self.tokens), 1)
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        for i, toks in enumerate(self.tokens):
+            for tok in toks:
+                self.postings[tok].add(i)
+        self.vocab = list(self.postings)
+        self.joined_vocab = JoinedLines(self.vocab)
+
+    def ids_containing(self, needle: str) -> Set[int]:
+        """Ids of the paths whose lowercased form contains `needle`."""
+        if TOKEN_SPLIT_RE.search(needle):
+            # Spans a separator, so no single token can hold it: scan the paths
+            return self.joined.lines_containing(needle)
+        # Otherwise it is a substring of a path iff it is one of its tokens'
+        ids: Set[int] = set()
+        for t in self.joined_vocab.lines_containing(needle):
+            ids |= self.postings[self.vocab[t]]
+        return ids
+
+    def term_frequency(self, i: int, needle: str) -> int:
+        if TOKEN_SPLIT_RE.search(needle):
+            return self.lower[i].count(needle)
+        return sum(1 for tok in self.tokens[i] if needle in tok)
+
+    def bm25(self, needles: List[str]) -> List[Tuple[int, float]]:
+        """BM25 scores of the paths containing any needle, best first."""
+        scores: Dict[int, float] = defaultdict(float)
+        for needle in needles:
+            ids = self.ids_containing(needle)
+            if not ids:
+                continue
+            idf = math.log(1 + (len(self.paths) - len(ids) + 0.5) / (len(ids) + 0.5))
+            for i in ids:
+                tf = self.term_frequency(i, needle)
+                norm = 1 - BM25_B + BM25_B * len(self.tokens[i]) / self.avg_len
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
 
 
 ALL_FILES = load_files()
+# Files never change at runtime: bucket them per year once instead of per command
+FILES_BY_YEAR = {
+    year: tuple(p for p in ALL_FILES if p.startswith(prefix))
+    for year, prefix in YEAR_PREFIXES.items()
+}
+YEAR_INDEXES = {year: PathIndex(files) for year, files in FILES_BY_YEAR.items()}
 
 
-def filter_by_year(files: List[str], year: int) -> List[str]:
-    prefix = {1: "1ere/", 2: "2eme/", 3: "3eme/"}.get(year)
-    if not prefix:
-        raise ValueError("Year must be 1, 2, or 3.")
-    return [p for p in files if p.startswith(prefix)]
-
-
-def simple_substring_prefilter(
-    query: str, candidates: List[str], limit: int
-) -> List[str]:
-    q = query.lower()
-    tokens = [t for t in q.replace("%20", " ").split() if t]
-
-    if not tokens:
-        return candidates[:limit]
+def rank_candidates(
+    query: str, index: PathIndex, limit: int
+) -> List[Tuple[str, float]]:
+    """Paths containing any query token (as a substring), best BM25 match first."""
+    tokens = query.lower().replace("%20", " ").split()
+    ranked = index.bm25(tokens)[:limit]
+    return [(index.paths[i], score) for i, score in ranked]
 
-    def keep(path: str) -> bool:
-        l = path.lower()
-        return any(tok in l for tok in tokens)
 
-    filtered = [p for p in candidates if keep(p)]
-    if not filtered:
-        return candidates[:limit]
-    return filtered[:limit]
+def is_decisive(scores: List[float], n: int) -> bool:
+    """True when the top n hits clearly beat the rest, so the LLM can be skipped."""
+    if len(scores) <= n:
+        return True
+    return scores[n - 1] >= LLM_SKIP_RATIO * scores[n]
 
 
 def folder_url_from_file_path(path: str) -> str:
@@ -81,12 +171,32 @@ def build_llm_prompt(query: str, candidates: List[str]) -> str:
 # --------------------------
 # LLM client
 # --------------------------
-openai_client = OpenAI()
+# One module-level client for every command: concurrent /old-exam calls share a
+# pool of keep-alive connections and multiplex over HTTP/2
+openai_client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+        ),
+    )
+)
+
+# LRU of past picks; the candidate list hash also pins the year
+_llm_cache: "OrderedDict[Tuple[str, str, int], Tuple[str, ...]]" = OrderedDict()
 
 
 async def llm_select_paths(query: str, candidates: List[str], n: int) -> List[str]:
+    cand_hash = hashlib.sha1("\n".join(candidates).encode("utf-8")).hexdigest()
+    key = (query.strip().lower(), cand_hash, n)
+    cached = _llm_cache.get(key)
+    if cached is not None:
+        _llm_cache.move_to_end(key)
+        return list(cached)
+
     prompt = build_llm_prompt(query, candidates)
-    resp = openai_client.chat.completions.create(
+    resp = await openai_client.chat.completions.create(
         model=OPENAI_MODEL,
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
@@ -106,6 +216,10 @@ async def llm_select_paths(query: str, candidates: List[str], n: int) -> List[st
 
     if not exact:
         exact = candidates[:n]
+
+    _llm_cache[key] = tuple(exact)
+    if len(_llm_cache) > LLM_CACHE_SIZE:
+        _llm_cache.popitem(last=False)
     return exact
 
 
@@ -146,9 +260,10 @@ class ExamsCog(commands.Cog):
 
         try:
             year_num = year.value
-            year_files = filter_by_year(ALL_FILES, year_num)
-            candidates = simple_substring_prefilter(
-                query, year_files, MAX_CANDIDATES_FOR_LLM
+            index = YEAR_INDEXES[year_num]
+            ranked = rank_candidates(query, index, LLM_TOP_K)
+            candidates = [p for p, _ in ranked] or list(
+                index.paths[:MAX_CANDIDATES_FOR_LLM]
             )
 
             if not candidates:
@@ -157,7 +272,10 @@ class ExamsCog(commands.Cog):
                 )
                 return
 
-            picks = await llm_select_paths(query, candidates, n=n)
+            if ranked and is_decisive([score for _, score in ranked], n):
+                picks = candidates[:n]
+            else:
+                picks = await llm_select_paths(query, candidates, n=n)
 
             embeds = []
             for p in picks:
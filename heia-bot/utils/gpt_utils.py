@@ -1,11 +1,11 @@
 import os
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
-def extract_next_day_deadlines(message_text: str, tomorrow_date: str) -> str:
+async def extract_next_day_deadlines(message_text: str, tomorrow_date: str) -> str:
     """
     Sends the entire pinned message to GPT and asks which line(s)
     correspond to the given tomorrow date (in dd.mm format).
@@ -25,7 +25,7 @@ Message content:
 {message_text}
 """
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
@@ -6,8 +6,16 @@ STATE_FILE = "data/reminder_state.json"
 
 os.makedirs("data", exist_ok=True)
 
+# Length of a hex SHA-1 digest, the fingerprint used by older state files
+_LEGACY_SHA1_HEX_LEN = 40
 
-def get_last_sent_hash():
+
+def _fingerprint(text: str) -> str:
+    # Only used for equality, so a short BLAKE2b digest is plenty
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_last_hash():
     if not os.path.exists(STATE_FILE):
         return None
     try:
@@ -17,13 +25,29 @@ def get_last_sent_hash():
         return None
 
 
+# The bot is the only writer, so the file is read once and then mirrored here
+_last_hash = _load_last_hash()
+
+
+def get_last_sent_hash():
+    return _last_hash
+
+
 def save_last_sent_hash(text: str):
-    h = hashlib.sha1(text.encode("utf-8")).hexdigest()
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
+    global _last_hash
+    h = _fingerprint(text)
+    # Write to a temp file and swap it in, so a crash never leaves a torn state file
+    tmp_file = STATE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
         json.dump({"last_hash": h}, f)
+    os.replace(tmp_file, STATE_FILE)
+    _last_hash = h
     return h
 
 
 def has_already_sent(text: str) -> bool:
-    h = hashlib.sha1(text.encode("utf-8")).hexdigest()
-    return h == get_last_sent_hash()
+    last_hash = get_last_sent_hash()
+    if last_hash is not None and len(last_hash) == _LEGACY_SHA1_HEX_LEN:
+        # Saved before the switch to BLAKE2b; the next save rewrites it
+        return hashlib.sha1(text.encode("utf-8")).hexdigest() == last_hash
+    return _fingerprint(text) == last_hash
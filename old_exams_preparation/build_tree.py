@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from collections import defaultdict
+
+
+def build_tree(nodes):
+    """Nest flat crawl entries (any order) under their parent paths."""
+    children_by_parent = defaultdict(list)
+    for node in nodes:
+        if node["type"] == "directory":
+            # Shared list: children seen later (or earlier) all land in it
+            node["children"] = children_by_parent[node["path"]]
+        children_by_parent[node["path"].rpartition("/")[0]].append(node)
+    return {
+        "type": "directory",
+        "name": "",
+        "path": "",
+        "children": children_by_parent[""],
+    }
+
+
+def iter_ndjson(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the nested tree JSON from the crawler's NDJSON output."
+    )
+    parser.add_argument("--infile", default="tree.ndjson", help="Input NDJSON file")
+    parser.add_argument("--outfile", default="tree.json", help="Output JSON file")
+    args = parser.parse_args()
+
+    with open(args.infile, "r", encoding="utf-8") as f:
+        tree = build_tree(iter_ndjson(f))
+
+    with open(args.outfile, "w", encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Nested tree written to {args.outfile}")
+
+
+if __name__ == "__main__":
+    main()
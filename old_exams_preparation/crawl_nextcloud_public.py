@@ -1,32 +1,155 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import contextlib
 import json
+import sqlite3
 import sys
-import time
+from email.utils import parsedate_to_datetime
 from urllib.parse import quote, urljoin
 from xml.etree import ElementTree as ET
 
-import requests
+import httpx
 
-NS = {
-    "d": "DAV:",
-    "nc": "http://nextcloud.org/ns",
-}
+from build_tree import build_tree
 
+RESPONSE_TAG = "{DAV:}response"
+HREF_TAG = "{DAV:}href"
+PROP_TAG = "{DAV:}prop"
+COLLECTION_TAG = "{DAV:}collection"
+CONTENT_LENGTH_TAG = "{DAV:}getcontentlength"
+LAST_MODIFIED_TAG = "{DAV:}getlastmodified"
+
+# Bytes handed to the XML parser at a time; nodes are yielded between chunks
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# Only the properties _node_from_prop consumes: every extra one (getcontenttype
+# in particular) costs Nextcloud a metadata lookup per entry and bloats the XML
 PROP_REQUEST_BODY = """<?xml version="1.0" encoding="utf-8" ?>
 <d:propfind xmlns:d="DAV:" xmlns:nc="http://nextcloud.org/ns">
   <d:prop>
     <d:resourcetype/>
     <d:getcontentlength/>
     <d:getlastmodified/>
-    <d:getcontenttype/>
   </d:prop>
 </d:propfind>""".strip()
 
+# Endpoint detection only needs to know the root answers at all
+PROBE_REQUEST_BODY = """<?xml version="1.0" encoding="utf-8" ?>
+<d:propfind xmlns:d="DAV:">
+  <d:prop>
+    <d:resourcetype/>
+  </d:prop>
+</d:propfind>""".strip()
+
+# Upper bound on PROPFINDs in flight at once while walking sibling folders
+MAX_CONCURRENT_PROPFINDS = 16
+# Those requests are multiplexed as HTTP/2 streams over a handful of connections
+MAX_CONNECTIONS = 8
+
+
+class PropfindTarget:
+    """
+    ElementTree parser target that reduces a multistatus body to one
+    ``(href, props, is_dir)`` record per <d:response> in a single linear scan,
+    without building elements or running find() lookups on them.
+
+    ``props`` maps the Clark-notation tag of each non-empty property to its text,
+    or is None when the response carried no <d:prop> at all.
+    """
+
+    def __init__(self):
+        self.responses = []  # completed records not consumed yet
+        self._text = []
+        self._reset()
+
+    def _reset(self):
+        self._href = ""
+        self._props = None
+        self._is_dir = False
+
+    def start(self, tag, attrib):
+        self._text.clear()
+        if tag == PROP_TAG and self._props is None:
+            self._props = {}
+        elif tag == COLLECTION_TAG:
+            self._is_dir = True
+
+    def data(self, data):
+        self._text.append(data)
+
+    def end(self, tag):
+        if tag == RESPONSE_TAG:
+            self.responses.append((self._href, self._props, self._is_dir))
+            self._reset()
+        elif tag == HREF_TAG:
+            self._href = "".join(self._text).strip()
+        elif tag in (CONTENT_LENGTH_TAG, LAST_MODIFIED_TAG):
+            text = "".join(self._text).strip()
+            if text and self._props is not None:
+                self._props[tag] = text
+        self._text.clear()
+
+    def close(self):
+        return self.responses
+
+
+# Statuses a retry won't change; servers that disable Depth: infinity answer with these
+NON_RETRYABLE_STATUSES = (400, 403, 501)
+
+
+class CacheStore:
+    """
+    SQLite store of raw PROPFIND bodies, keyed by (href, depth) and validated
+    against the folder's getlastmodified.
+
+    Nextcloud bumps a folder's mtime whenever anything below it changes, so an
+    unchanged mtime means the cached listing (and its whole subtree) is current.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS propfind ("
+            "href TEXT, depth TEXT, lastmod INTEGER, xml BLOB, "
+            "PRIMARY KEY (href, depth))"
+        )
+
+    def get(self, href, depth, lastmod):
+        row = self.conn.execute(
+            "SELECT xml FROM propfind WHERE href = ? AND depth = ? AND lastmod = ?",
+            (href, depth, lastmod),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, href, depth, lastmod, xml):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO propfind VALUES (?, ?, ?, ?)",
+                (href, depth, lastmod, xml),
+            )
+
+    def delete(self, href, depth):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM propfind WHERE href = ? AND depth = ?", (href, depth)
+            )
+
+    def close(self):
+        self.conn.close()
+
 
 class Crawler:
     def __init__(
-        self, base, token, password=None, timeout=30, max_retries=3, backoff=0.8
+        self,
+        base,
+        token,
+        password=None,
+        timeout=30,
+        max_retries=3,
+        backoff=0.8,
+        max_concurrency=MAX_CONCURRENT_PROPFINDS,
+        cache=None,
     ):
         # Nextcloud public WebDAV endpoints
         self.webdav_root = urljoin(base.rstrip("/") + "/", "public.php/webdav/")
@@ -34,21 +157,32 @@ class Crawler:
         self.alt_root_template = urljoin(
             base.rstrip("/") + "/", f"public.php/dav/files/{token}/"
         )
-        self.session = requests.Session()
         # For most installations: user=token, pass=(empty or share password)
-        self.session.auth = (token, password or "")
+        # http2=True needs the h2 package: pip install "httpx[http2]"
+        self.client = httpx.AsyncClient(
+            http2=True,
+            auth=(token, password or ""),
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+        )
         self.timeout = timeout
         self.max_retries = max_retries
         self.backoff = backoff
+        self.sem = asyncio.BoundedSemaphore(max_concurrency)
+        self.cache = cache
         self.base_share_url = urljoin(base.rstrip("/") + "/", f"index.php/s/{token}/")
 
+    async def _detect_root(self):
         # Detect which endpoint works
         print(f"Debug: Trying WebDAV root: {self.webdav_root}")
-        if not self._probe(self.webdav_root):
+        if not await self._probe(self.webdav_root):
             print(
                 f"Debug: {self.webdav_root} did not work, trying alternative root: {self.alt_root_template}"
             )
-            if self._probe(self.alt_root_template):
+            if await self._probe(self.alt_root_template):
                 self.webdav_root = self.alt_root_template
                 print(f"Debug: Using alternative WebDAV root: {self.webdav_root}")
             else:
@@ -60,35 +194,34 @@ class Crawler:
         else:
             print(f"Debug: Using WebDAV root: {self.webdav_root}")
 
-    def _probe(self, url):
+    async def _probe(self, url):
         print(f"Debug: Probing {url}")
         try:
-            r = self.session.request(
+            r = await self.client.request(
                 "PROPFIND",
                 url,
                 headers={"Depth": "0"},
-                data=PROP_REQUEST_BODY,
-                timeout=self.timeout,
+                content=PROBE_REQUEST_BODY,
             )
             print(f"Debug: Probe status code: {r.status_code}")
             return r.status_code in (207, 301, 302)
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Debug: Probe exception: {e}")
             return False
 
-    def _propfind(self, href, depth="1"):
-        # Robust PROPFIND with basic retry
+    async def _propfind(self, href, depth="1"):
+        # Robust PROPFIND with basic retry; the semaphore caps requests in flight
         last_exc = None
         for attempt in range(1, self.max_retries + 1):
             try:
                 print(f"Debug: PROPFIND {href} (attempt {attempt}, depth {depth})")
-                r = self.session.request(
-                    "PROPFIND",
-                    href,
-                    headers={"Depth": depth},
-                    data=PROP_REQUEST_BODY,
-                    timeout=self.timeout,
-                )
+                async with self.sem:
+                    r = await self.client.request(
+                        "PROPFIND",
+                        href,
+                        headers={"Depth": depth},
+                        content=PROP_REQUEST_BODY,
+                    )
                 print(f"Debug: PROPFIND status code {r.status_code}")
                 if r.status_code not in (207,):
                     # Some servers redirect without auth headers on first go; follow and retry once
@@ -97,20 +230,30 @@ class Crawler:
                         href = r.headers.get("Location", href)
                         continue
                     r.raise_for_status()
-                return r.text
-            except requests.RequestException as e:
+                return r.content
+            except httpx.HTTPError as e:
+                if (
+                    isinstance(e, httpx.HTTPStatusError)
+                    and e.response.status_code in NON_RETRYABLE_STATUSES
+                ):
+                    raise
                 print(
                     f"Debug: PROPFIND exception: {e}, sleeping for {self.backoff * attempt} seconds"
                 )
                 last_exc = e
-                time.sleep(self.backoff * attempt)
+                await asyncio.sleep(self.backoff * attempt)
         print(f"Debug: All PROPFIND attempts failed")
         raise last_exc
 
     @staticmethod
-    def _is_collection(prop_elem):
-        rt = prop_elem.find("d:resourcetype", NS)
-        return rt is not None and rt.find("d:collection", NS) is not None
+    def _epoch(http_date):
+        # RFC 1123 date -> epoch seconds, parsed once here instead of by every consumer
+        if not http_date:
+            return None
+        try:
+            return int(parsedate_to_datetime(http_date).timestamp())
+        except (TypeError, ValueError):
+            return None
 
     def _normalize_child_href(self, href):
         # Normalize to a path relative to root
@@ -144,22 +287,18 @@ class Crawler:
             + quote(fname)
         )
 
-    def _node_from_prop(self, root_href, response_elem):
-        href = response_elem.findtext("d:href", default="", namespaces=NS)
+    def _node_from_prop(self, root_href, href, props, is_dir):
         if not href:
             return None
 
         href = self._normalize_child_href(urljoin(root_href, href))
         # Convert to a display path relative to webdav_root
         rel = href[len(self.webdav_root) :].strip("/")
-        prop = response_elem.find(".//d:prop", NS)
-        if prop is None:
+        if props is None:
             return None
 
-        is_dir = self._is_collection(prop)
-        size = prop.findtext("d:getcontentlength", default="", namespaces=NS)
-        mtime = prop.findtext("d:getlastmodified", default="", namespaces=NS)
-        ctype = prop.findtext("d:getcontenttype", default="", namespaces=NS)
+        size = props.get(CONTENT_LENGTH_TAG, "")
+        mtime = props.get(LAST_MODIFIED_TAG, "")
 
         name = rel.split("/")[-1] if rel else ""  # root comes back too; filter later
 
@@ -168,63 +307,206 @@ class Crawler:
             "path": rel,  # path relative to the share root
             "type": "directory" if is_dir else "file",
             "size": int(size) if size.isdigit() else None,
-            "last_modified": mtime or None,
-            "content_type": ctype or None,
+            "last_modified": self._epoch(mtime),  # epoch seconds
         }
         if not is_dir and rel:
             node["web_url"] = self._browser_url_for_file(rel)
         print(f"Debug: Parsed node: {node}")
         return node
 
-    def list_dir(self, href):
+    async def _cached_propfind(self, href, depth, lastmod):
+        # Reuse the stored body when the folder's mtime hasn't moved since we saved it
+        if self.cache is not None and lastmod is not None:
+            xml_bytes = self.cache.get(href, depth, lastmod)
+            if xml_bytes is not None:
+                print(f"Debug: Cache hit for {href} (depth {depth})")
+                return xml_bytes
+        xml_bytes = await self._propfind(href, depth=depth)
+        if self.cache is not None and lastmod is not None:
+            self.cache.put(href, depth, lastmod, xml_bytes)
+        return xml_bytes
+
+    async def _root_lastmod(self):
+        # Only worth a Depth:0 round-trip when there is a cache to validate against
+        if self.cache is None:
+            return None
+        xml_bytes = await self._propfind(self.webdav_root, depth="0")
+        for node in self._iter_nodes(self.webdav_root, xml_bytes):
+            return node["last_modified"]
+        return None
+
+    def _iter_nodes(self, href, xml_bytes):
+        # Feed the multistatus body to a parser target chunk by chunk and yield the
+        # nodes completed so far after each one: no DOM is ever built
+        target = PropfindTarget()
+        parser = ET.XMLParser(target=target)
+        for offset in range(0, len(xml_bytes), PARSE_CHUNK_SIZE):
+            parser.feed(xml_bytes[offset : offset + PARSE_CHUNK_SIZE])
+            yield from self._drain_nodes(href, target)
+        parser.close()
+        yield from self._drain_nodes(href, target)
+
+    def _drain_nodes(self, href, target):
+        responses, target.responses = target.responses, []
+        for response in responses:
+            node = self._node_from_prop(href, *response)
+            if node:
+                yield node
+
+    async def list_dir(self, href, lastmod=None):
         print(f"Debug: Listing directory {href}")
-        xml_text = self._propfind(href, depth="1")
-        root = ET.fromstring(xml_text)
+        rel = href[len(self.webdav_root) :].strip("/")
+        xml_bytes = await self._cached_propfind(href, "1", lastmod)
         items = []
-        for resp in root.findall("d:response", NS):
-            node = self._node_from_prop(href, resp)
-            if not node:
-                continue
+        for node in self._iter_nodes(href, xml_bytes):
             # Skip the collection itself (Depth:1 returns the queried folder as first item)
-            if (
-                node["path"] == ""
-                or href.rstrip("/") == self.webdav_root.rstrip("/")
-                and node["name"] == ""
-            ):
+            if node["path"] == rel:
                 continue
             items.append(node)
         print(f"Debug: list_dir found {len(items)} items in {href}")
         return items
 
-    def crawl(self):
+    async def list_tree(self, lastmod=None):
+        """
+        List the whole share with a single Depth: infinity PROPFIND.
+
+        Returns a generator of flat entries (share root excluded), parsed lazily
+        from the response body.
+        """
+        print("Debug: Listing whole share with Depth: infinity")
+        xml_bytes = await self._cached_propfind(self.webdav_root, "infinity", lastmod)
+        return (
+            node
+            for node in self._iter_nodes(self.webdav_root, xml_bytes)
+            if node["path"]
+        )
+
+    async def walk(self, href, lastmod=None):
+        """
+        Fallback for servers without Depth: infinity: one Depth:1 PROPFIND per
+        folder, yielding flat entries as each folder is listed. Sibling folders
+        are listed concurrently (bounded by ``self.sem``), so the wall time grows
+        with the depth of the share, not its folder count.
+
+        Each folder's mtime comes from its parent's listing, so cached listings
+        are validated without an extra request. All listings run in one task
+        group: the first failure cancels the others, so none of them is left
+        sending requests once the caller closes the client.
+        """
+        queue = asyncio.Queue()
         visited = set()
 
-        def walk(href):
+        async def visit(tg, href, lastmod):
             rel = href[len(self.webdav_root) :].strip("/")
             if rel in visited:
-                return []  # prevent infinite recursion
+                return  # prevent infinite recursion
             visited.add(rel)
 
-            children = self.list_dir(href)
-            result_children = []
+            children = await self.list_dir(href, lastmod)
             for child in children:
+                queue.put_nowait(child)
                 if child["type"] == "directory":
-                    sub_href = urljoin(self.webdav_root, child["path"] + "/")
-                    child["children"] = walk(sub_href)
-                result_children.append(child)
-            return result_children
-
-        return {
-            "type": "directory",
-            "name": "",
-            "path": "",
-            "children": walk(self.webdav_root),
-        }
+                    child_href = urljoin(self.webdav_root, child["path"] + "/")
+                    tg.create_task(visit(tg, child_href, child["last_modified"]))
+
+        async def visit_all():
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(visit(tg, href, lastmod))
+            except* Exception as group:
+                # Re-raise the first failure as is, like asyncio.gather did
+                raise group.exceptions[0]
+
+        task = asyncio.ensure_future(visit_all())
+        # Runs after the last put, so the sentinel is always the final item
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (node := await queue.get()) is not None:
+                yield node
+            await task  # surface crawl errors
+        finally:
+            # The consumer stopped early: stop listing before the client closes
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+    async def crawl_stream(self):
+        """
+        Yield every entry of the share as a flat node (no ``children``), as soon
+        as it is parsed; ``build_tree`` nests them again.
+
+        Tries a single Depth: infinity PROPFIND first and falls back to the
+        per-folder walk when the server refuses it, or silently answers it as
+        Depth: 1. The HTTP client is closed afterwards: a crawler instance is
+        single-use.
+        """
+        async with self.client:
+            await self._detect_root()
+            lastmod = await self._root_lastmod()
+            try:
+                nodes = await self.list_tree(lastmod)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in NON_RETRYABLE_STATUSES:
+                    raise
+                print(
+                    f"Debug: Depth: infinity refused ({e.response.status_code}), "
+                    "falling back to per-folder walk"
+                )
+                nodes = None
+
+            if nodes is not None:
+                # sabre/dav (Nextcloud) rewrites a disabled Depth: infinity to
+                # Depth: 1 and still answers 207. Top-level entries are held back
+                # until one deeper entry proves the listing is really recursive.
+                top_level = []
+                recursive = False
+                for node in nodes:
+                    if recursive:
+                        yield node
+                    elif "/" in node["path"]:
+                        recursive = True
+                        for held in top_level:
+                            yield held
+                        yield node
+                    else:
+                        top_level.append(node)
+                if recursive or not any(n["type"] == "directory" for n in top_level):
+                    return
+                print(
+                    "Debug: Depth: infinity answered with a single level, "
+                    "falling back to per-folder walk"
+                )
+                # Don't let the truncated body be reused on the next run
+                if self.cache is not None:
+                    self.cache.delete(self.webdav_root, "infinity")
+
+            # aclosing: if we are closed early, the walk stops before the client does
+            walk = self.walk(self.webdav_root, lastmod)
+            async with contextlib.aclosing(walk):
+                async for node in walk:
+                    yield node
+
+    async def crawl(self):
+        """Return the whole share as a nested tree."""
+        return build_tree([node async for node in self.crawl_stream()])
+
+
+async def write_ndjson(crawler, path):
+    # One entry per line, written as it arrives: memory stays flat and a crash
+    # keeps everything listed so far
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        async for node in crawler.crawl_stream():
+            f.write(json.dumps(node, ensure_ascii=False) + "\n")
+            count += 1
+    return count
 
 
 def main():
     ap = argparse.ArgumentParser(
-        description="Recursively crawl a Nextcloud public share over WebDAV and emit JSON."
+        description="Recursively crawl a Nextcloud public share over WebDAV and emit "
+        "NDJSON (one entry per line; build_tree.py turns it into nested JSON)."
     )
     ap.add_argument(
         "--base", required=True, help="Base URL, e.g. https://drive.switch.ch"
@@ -237,19 +519,38 @@ def main():
         default=None,
         help="Share password if the link is password-protected",
     )
-    ap.add_argument("--out", default="tree.json", help="Output JSON file")
+    ap.add_argument("--out", default="tree.ndjson", help="Output NDJSON file")
+    ap.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENT_PROPFINDS,
+        help="Maximum number of PROPFIND requests in flight",
+    )
+    ap.add_argument(
+        "--cache",
+        default=None,
+        help="SQLite file caching listings between runs, e.g. propfind_cache.sqlite",
+    )
     args = ap.parse_args()
 
     try:
         print(
             f"Debug: Starting crawl with base={args.base}, token={args.token}, password={args.password}"
         )
-        crawler = Crawler(args.base, args.token, password=args.password)
-        tree = crawler.crawl()
-        print("Debug: Writing output JSON")
-        with open(args.out, "w", encoding="utf-8") as f:
-            json.dump(tree, f, ensure_ascii=False, indent=2)
-        print(f"Wrote {args.out}")
+        cache = CacheStore(args.cache) if args.cache else None
+        crawler = Crawler(
+            args.base,
+            args.token,
+            password=args.password,
+            max_concurrency=args.concurrency,
+            cache=cache,
+        )
+        try:
+            count = asyncio.run(write_ndjson(crawler, args.out))
+        finally:
+            if cache is not None:
+                cache.close()
+        print(f"Wrote {count} entries to {args.out}")
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
         sys.exit(1)
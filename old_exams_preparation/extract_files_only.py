@@ -1,22 +1,24 @@
 #!/usr/bin/env python3
 import argparse
 import json
-import os
 
 
-def collect_files(node, out_set):
-    """Recursively collect paths that look like actual files (have an extension)."""
-    path = node.get("path")
-    children = node.get("children", [])
+def iter_files(root):
+    """Yield paths that look like actual files (have an extension), depth-first."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        path = node.get("path")
+        children = node.get("children") or ()
 
-    # if no children and filename has an extension -> file
-    if not children and path and os.path.splitext(path)[1]:
-        out_set.add(path)
-        return
+        # if no children and filename has an extension -> file
+        # (same rule as os.path.splitext: leading dots don't start an extension)
+        if not children and path and "." in path.rpartition("/")[2].lstrip("."):
+            yield path
+            continue
 
-    # recurse into children
-    for child in children:
-        collect_files(child, out_set)
+        # explicit stack instead of recursion: no depth limit on deep shares
+        stack.extend(children)
 
 
 def main():
@@ -32,11 +34,8 @@ def main():
     with open(args.infile, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    files = set()
-    collect_files(data, files)
-
-    # sort alphabetically
-    sorted_files = sorted(files)
+    # dedupe and sort alphabetically
+    sorted_files = sorted(set(iter_files(data)))
 
     with open(args.outfile, "w", encoding="utf-8") as f:
         json.dump(sorted_files, f, ensure_ascii=False, indent=2)
@@ -1,9 +1,23 @@
 #!/usr/bin/env python3
 import argparse
-import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    cast,
+)
 
-# Folder names to delete (case-insensitive)
-# Folder names to delete (lowercase, normalized)
+import orjson
+
+# Folder names to delete (lowercase, normalized; matching is case-insensitive)
 SKIP_NAMES = {
     "resume",
     "cheat_sheet",
@@ -14,7 +28,7 @@ SKIP_NAMES = {
     "projet",
     "wortschatz",
     "exercices_moodle",
-    "Exercice_moodle",
+    "exercice_moodle",
     "exos simulation matlab",  # normalized (catch both %20 and space)
     "code",
     "applications_mobiles",
@@ -66,7 +80,51 @@ OLD_YEARS = [
 ]
 
 
-def should_skip(node_name):
+def _prefix_factored_pattern(words: Iterable[str]) -> str:
+    """Regex source matching any of words, with shared prefixes factored out.
+
+    re tries a flat alternation branch by branch at every position; nested by
+    prefix ("20(?:0(?:3|4|...)|1(?:0|...))"), one failed character rules out a
+    whole group of words at once.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of a word
+
+    def emit(node: Dict[str, Any]) -> str:
+        if "" in node:
+            # A shorter word already matches here; longer ones add nothing
+            return ""
+        branches = [re.escape(char) + emit(child) for char, child in node.items()]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return emit(trie)
+
+
+# Built once: one set lookup and one C-level scan per node instead of Python loops.
+# The .lower() is a no-op for the names above; it keeps later additions safe.
+SKIP_SET: FrozenSet[str] = frozenset(skip.lower() for skip in SKIP_NAMES)
+# Names are lowercased before matching, so the patterns must be too
+YEAR_RE = re.compile(_prefix_factored_pattern(year.lower() for year in OLD_YEARS))
+
+
+class _NodeFields(TypedDict):
+    name: Optional[str]
+    path: Optional[str]
+
+
+class Node(_NodeFields, total=False):
+    """A simplified/filtered tree node; files have no "children" key."""
+
+    children: List["Node"]
+
+
+# Names repeat a lot across subjects ("2023", "tp", "exams"...), so each is checked once
+@lru_cache(maxsize=None)
+def should_skip(node_name: Optional[str]) -> bool:
     """Return True if this node should be deleted."""
     if not node_name:
         return False
@@ -74,39 +132,111 @@ def should_skip(node_name):
     name = node_name.lower().replace("%20", " ")
 
     # Skip if folder matches SKIP_NAMES (match whole name, case insensitive)
-    for skip in SKIP_NAMES:
-        if name == skip.lower():
-            return True
+    if name in SKIP_SET:
+        return True
 
     # Skip if old year pattern appears in name
-    for year in OLD_YEARS:
-        if year in name:
-            return True
-
-    return False
+    return YEAR_RE.search(name) is not None
 
 
-def filter_node(node):
-    """Recursively filter out unwanted folders or old exams."""
-    name = node.get("name", "")
-    if should_skip(name):
+def filter_node(node: Node) -> Optional[Node]:
+    """Filter out unwanted folders or old exams, walking the tree with a stack."""
+    if should_skip(node.get("name", "")):
         return None
 
-    filtered = {"name": node.get("name"), "path": node.get("path")}
+    filtered: Node = {"name": node.get("name"), "path": node.get("path")}
 
-    if "children" in node and isinstance(node["children"], list):
+    # (source node, its filtered copy) pairs still to visit; no recursion limit
+    stack: List[Tuple[Node, Node]] = [(node, filtered)]
+    while stack:
+        src, dst = stack.pop()
+        children = src.get("children")
+        if not children:
+            continue
         kept_children = []
-        for child in node["children"]:
-            filtered_child = filter_node(child)
-            if filtered_child is not None:
-                kept_children.append(filtered_child)
+        for child in children:
+            if should_skip(child.get("name", "")):
+                continue
+            filtered_child: Node = {
+                "name": child.get("name"),
+                "path": child.get("path"),
+            }
+            kept_children.append(filtered_child)
+            stack.append((child, filtered_child))
         if kept_children:
-            filtered["children"] = kept_children
+            dst["children"] = kept_children
 
     return filtered
 
 
-def main():
+def _reduce_to_node(node: Dict[str, Any]) -> None:
+    """Drop every key but name/path/children, in the order filter_node emits."""
+    keys = tuple(node)
+    if keys == ("name", "path", "children") or keys == ("name", "path"):
+        return  # already simplified
+    name, path, children = node.get("name"), node.get("path"), node.get("children")
+    node.clear()
+    node["name"] = name
+    node["path"] = path
+    if children is not None:
+        node["children"] = children
+
+
+def filter_inplace(root: Dict[str, Any]) -> Optional[Node]:
+    """Same result as filter_node, but reuses root's own dicts and children lists.
+
+    Saves a dict and a list per node when the input is discarded afterwards.
+    Crawl fields (type, size, web_url...) are dropped from the kept nodes.
+    """
+    if should_skip(root.get("name", "")):
+        return None
+
+    _reduce_to_node(root)
+    stack: List[Dict[str, Any]] = [root]
+    while stack:
+        node = stack.pop()
+        children = node.get("children")
+        if children:
+            children[:] = [c for c in children if not should_skip(c.get("name", ""))]
+        if children:
+            for child in children:
+                _reduce_to_node(child)
+            stack.extend(children)
+        elif children is not None:
+            # filter_node never emits an empty children list
+            del node["children"]
+
+    return cast(Node, root)
+
+
+def filter_tree(root: Dict[str, Any], workers: int = 1) -> Optional[Node]:
+    """filter_inplace, with the root's subtrees filtered in worker processes.
+
+    The subtrees are independent, but pickling them costs more than filtering a
+    small one, so this falls back to a single process unless each worker gets
+    at least two of them. root is modified either way.
+    """
+    children = root.get("children")
+    if workers <= 1 or not children or len(children) < workers * 2:
+        return filter_inplace(root)
+    if should_skip(root.get("name", "")):
+        return None
+
+    _reduce_to_node(root)
+    children = root["children"]
+    # Workers get pickled copies, so the filtered subtrees come back as new objects
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        children[:] = [
+            child
+            for child in executor.map(filter_inplace, children)
+            if child is not None
+        ]
+    if not children:
+        del root["children"]
+    return cast(Node, root)
+
+
+def main() -> None:
     parser = argparse.ArgumentParser(
         description="Filter out unwanted folders and old exams from tree JSON."
     )
@@ -116,15 +246,21 @@ def main():
     parser.add_argument(
         "--outfile", default="tree_filtered.json", help="Output JSON file"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes to filter the top-level folders in (default: 1)",
+    )
     args = parser.parse_args()
 
-    with open(args.infile, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(args.infile, "rb") as f:
+        data = orjson.loads(f.read())
 
-    filtered = filter_node(data)
+    filtered = filter_tree(data, args.workers)
 
-    with open(args.outfile, "w", encoding="utf-8") as f:
-        json.dump(filtered, f, ensure_ascii=False, indent=2)
+    with open(args.outfile, "wb") as f:
+        f.write(orjson.dumps(filtered, option=orjson.OPT_INDENT_2))
 
     print(f"✅ Filtered tree written to {args.outfile}")
 
@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import io
 import json
 import os
+import re
+import sqlite3
+from functools import lru_cache
+from urllib.parse import unquote
 
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -10,21 +17,129 @@ load_dotenv()
 
 BASE_URL = "https://drive.switch.ch/index.php/s/BnL19x4G1Xk0Ran"
 
+YEAR_PREFIXES = {"1ere": 1, "2eme": 2, "3eme": 3}
+
+CACHE_DIR = os.path.expanduser("~/.cache/heia_bot")
+CACHE_FILE = os.path.join(CACHE_DIR, "find_exam.sqlite")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 1000
+# Paths sent to the chat model per query after embedding pre-ranking (0: all)
+EMBED_TOP_K = 30
+
 # Your file list
-with open("files.json", "r", encoding="utf-8") as f:
-    FILES = json.load(f)
+with open("files.json", "rb") as f:
+    FILES_JSON = f.read()
+FILES = json.loads(FILES_JSON)
+FILE_SET = frozenset(FILES)
+# Part of every cache key, so regenerating files.json invalidates old answers
+FILES_HASH = hashlib.blake2b(FILES_JSON, digest_size=16).hexdigest()
+EMBEDDINGS_FILE = os.path.join(CACHE_DIR, f"files_emb_{FILES_HASH}.npy")
+
+# Bucketed once at load, so a query only does a dict lookup. ROWS_BY_YEAR holds
+# the matching indexes into FILES (and so into the embedding matrix).
+FILES_BY_YEAR = {year: [] for year in YEAR_PREFIXES.values()}
+ROWS_BY_YEAR = {year: [] for year in YEAR_PREFIXES.values()}
+for i, p in enumerate(FILES):
+    year = YEAR_PREFIXES.get(p.split("/", 1)[0])
+    if year is not None and "/" in p:
+        FILES_BY_YEAR[year].append(p)
+        ROWS_BY_YEAR[year].append(i)
 
 
-def filter_by_year(files, year):
+def filter_by_year(year):
     """Return only the paths matching the selected year."""
-    prefix = {
-        1: "1ere/",
-        2: "2eme/",
-        3: "3eme/",
-    }.get(year)
-    if not prefix:
+    if year not in FILES_BY_YEAR:
         raise ValueError("Year must be 1, 2, or 3.")
-    return [p for p in files if p.startswith(prefix)]
+    return FILES_BY_YEAR[year]
+
+
+def build_trie(paths):
+    """Nest paths into a dict of dicts, one level per folder (files are leaves)."""
+    trie = {}
+    for p in paths:
+        node = trie
+        for part in p.split("/"):
+            node = node.setdefault(part, {})
+    return trie
+
+
+# Prompt-side view of the files: shared folders are listed once, not once per path
+FILES_TRIE = build_trie(FILES)
+TRIES_BY_YEAR = {year: build_trie(paths) for year, paths in FILES_BY_YEAR.items()}
+FILE_SETS_BY_YEAR = {year: frozenset(paths) for year, paths in FILES_BY_YEAR.items()}
+
+
+def render(node, out):
+    """Write the trie to out as indented lines, each name nested under its folder.
+
+    Every line is preceded (not followed) by its newline.
+    """
+    # One iterator per open folder, so any depth renders without recursion
+    stack = [iter(node.items())]
+    while stack:
+        for name, child in stack[-1]:
+            out.write("\n")
+            out.write("  " * (len(stack) - 1))
+            out.write(name)
+            if child:
+                stack.append(iter(child.items()))
+            break
+        else:
+            stack.pop()
+
+
+def _embed(texts):
+    """Unit-length float32 embeddings of texts, one row each."""
+    # numpy is only needed for pre-ranking, so --top-k 0 runs without it
+    import numpy as np
+
+    client = OpenAI()
+    rows = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        resp = client.embeddings.create(
+            model=EMBEDDING_MODEL, input=texts[start : start + EMBEDDING_BATCH_SIZE]
+        )
+        rows.extend(item.embedding for item in resp.data)
+    matrix = np.asarray(rows, dtype=np.float32)
+    # Normalized once, so cosine similarity is a plain dot product
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@lru_cache(maxsize=1)
+def file_embeddings():
+    """Embedding matrix of FILES, computed once per files.json and kept on disk."""
+    import numpy as np
+
+    if os.path.exists(EMBEDDINGS_FILE):
+        return np.load(EMBEDDINGS_FILE)
+    # Decoded, so "Cours%20obsol%c3%a8tes" is embedded as "Cours obsolètes"
+    matrix = _embed([unquote(p) for p in FILES])
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    np.save(EMBEDDINGS_FILE, matrix)
+    return matrix
+
+
+@lru_cache(maxsize=256)
+def embed_query(query):
+    return _embed([query])[0]
+
+
+def top_k_paths(query, year=None, k=EMBED_TOP_K):
+    """The k paths (of the selected year) closest to query, best first."""
+    import numpy as np
+
+    paths = filter_by_year(year) if year else FILES
+    matrix = file_embeddings()
+    if year:
+        matrix = matrix[ROWS_BY_YEAR[year]]
+    scores = matrix @ embed_query(query)
+    if k < len(paths):
+        top = np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+    else:
+        top = np.argsort(-scores)
+    return [paths[i] for i in top]
 
 
 def build_url(path: str) -> str:
@@ -36,21 +151,74 @@ def build_url(path: str) -> str:
     return f"{BASE_URL}?path={encoded}#pdfviewer"
 
 
-def find_exam(query, year=None):
-    """Send query + filtered paths to LLM and return best path(s)."""
-    candidates = FILES
-    if year:
-        candidates = filter_by_year(FILES, year)
-
-    # Build prompt
-    prompt = (
-        f"The user asked for: {query}\n"
-        "Choose the most relevant file path(s) from the list below.\n"
-        "Only respond with one or several exact paths (one per line) from the list.\n\n"
-        + "\n".join(candidates)
-    )
+class ResponseCache:
+    """
+    SQLite store of LLM answers, keyed by (query, year, top_k, files.json hash).
+
+    top_k is part of the key because a shortlist answer and a full-listing
+    answer come from different candidates.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+        if columns and "top_k" not in columns:
+            # Written before top_k was keyed: its answers can't be told apart
+            with self.conn:
+                self.conn.execute("DROP TABLE answers")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "query TEXT, year INTEGER, top_k INTEGER, files_hash TEXT, answer TEXT, "
+            "PRIMARY KEY (query, year, top_k, files_hash))"
+        )
+
+    @staticmethod
+    def _key(query, year, top_k):
+        # year/top_k are stored as 0 when unset: NULLs never compare equal in SQL
+        return (query.strip().lower(), year or 0, top_k or 0, FILES_HASH)
+
+    def get(self, query, year, top_k):
+        row = self.conn.execute(
+            "SELECT answer FROM answers "
+            "WHERE query = ? AND year = ? AND top_k = ? AND files_hash = ?",
+            self._key(query, year, top_k),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, query, year, top_k, answer):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (*self._key(query, year, top_k), answer),
+            )
 
-    # Query LLM
+    def close(self):
+        self.conn.close()
+
+
+def candidates_for(year):
+    """Return (paths, trie) the LLM picks from: one year's files, or all of them."""
+    if not year:
+        return FILE_SET, FILES_TRIE
+    if year not in TRIES_BY_YEAR:
+        raise ValueError("Year must be 1, 2, or 3.")
+    return FILE_SETS_BY_YEAR[year], TRIES_BY_YEAR[year]
+
+
+def known_paths(lines, shown):
+    """Keep the answer lines that are among the shown paths, once each.
+
+    The model rebuilds paths from the indented tree, so a misspelt, invented or
+    out-of-listing one (another year, outside the shortlist) must not reach
+    build_url or the cache.
+    """
+    kept = dict.fromkeys(line.strip() for line in lines if line.strip() in shown)
+    return "\n".join(kept)
+
+
+def ask_llm(prompt):
+    """Send a single-message prompt and return the stripped answer."""
     client = OpenAI()
 
     resp = client.chat.completions.create(
@@ -58,14 +226,140 @@ def find_exam(query, year=None):
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
     )
-    result = resp.choices[0].message.content.strip()
+    return resp.choices[0].message.content.strip()
+
+
+def find_exam(query, year=None, cache=None, top_k=EMBED_TOP_K):
+    """Send query + filtered paths to LLM and return best path(s).
+
+    With top_k, only the top_k paths closest to the query by embedding are sent
+    instead of the whole tree.
+    """
+    if cache is not None:
+        cached = cache.get(query, year, top_k)
+        if cached is not None:
+            return cached
+
+    if top_k:
+        shortlist = top_k_paths(query, year, top_k)
+        shown = frozenset(shortlist)
+        candidates = build_trie(shortlist)
+    else:
+        shown, candidates = candidates_for(year)
+
+    # Build prompt in one buffer, straight from the trie walk
+    buf = io.StringIO()
+    buf.write(f"The user asked for: {query}\n")
+    buf.write(
+        "Choose the most relevant file path(s) from the tree below, where each "
+        "name is indented under the folder that contains it.\n"
+        "Only respond with one or several exact full paths (one per line), "
+        "joining the names from the top folder down with '/'.\n"
+    )
+    render(candidates, buf)
+
+    result = known_paths(ask_llm(buf.getvalue()).splitlines(), shown)
+    # An answer with no valid path is not worth remembering
+    if cache is not None and result:
+        cache.put(query, year, top_k, result)
     return result
 
 
+# "3:" / "3." / "3)" opening an answer section, possibly followed by a first path
+SECTION_RE = re.compile(r"^\s*(\d+)\s*[:.)]\s*(.*)$")
+
+
+def find_exams(queries, cache=None, top_k=EMBED_TOP_K):
+    """find_exam for several (query, year) pairs, one LLM call per distinct year.
+
+    The file tree is by far the biggest part of the prompt, so queries for the
+    same year share a single listing and are answered in numbered sections.
+    With top_k, the listing is the union of each query's top_k paths.
+    Returns the answers in the order of queries.
+    """
+    results = [None] * len(queries)
+    pending_by_year = {}
+    for i, (query, year) in enumerate(queries):
+        cached = cache.get(query, year, top_k) if cache is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending_by_year.setdefault(year or None, []).append(i)
+
+    for year, indexes in pending_by_year.items():
+        if len(indexes) == 1:
+            query = queries[indexes[0]][0]
+            results[indexes[0]] = find_exam(query, year, cache, top_k)
+            continue
+
+        if top_k:
+            # dict.fromkeys: union of the shortlists, in first-seen order
+            shown = dict.fromkeys(
+                p for i in indexes for p in top_k_paths(queries[i][0], year, top_k)
+            )
+            candidates = build_trie(shown)
+        else:
+            shown, candidates = candidates_for(year)
+
+        buf = io.StringIO()
+        buf.write("Several users asked for:\n")
+        for n, i in enumerate(indexes, 1):
+            buf.write(f"{n}. {queries[i][0]}\n")
+        buf.write(
+            "For each request, choose the most relevant file path(s) from the tree "
+            "below, where each name is indented under the folder that contains it.\n"
+            "Answer each request in its own section: a line with just its number "
+            "and a colon (e.g. '1:'), then one or several exact full paths (one "
+            "per line), joining the names from the top folder down with '/'.\n"
+        )
+        render(candidates, buf)
+
+        sections = {}
+        current = None
+        for line in ask_llm(buf.getvalue()).splitlines():
+            header = SECTION_RE.match(line)
+            if header:
+                n = int(header.group(1))
+                # Out-of-range numbers close the section instead of joining it
+                in_range = 1 <= n <= len(indexes)
+                current = sections.setdefault(n, []) if in_range else None
+                line = header.group(2)
+            if current is not None and line.strip():
+                current.append(line.strip())
+
+        for n, i in enumerate(indexes, 1):
+            results[i] = known_paths(sections.get(n, ()), shown)
+            # Left unanswered or only invalid paths: nothing cached
+            if cache is not None and results[i]:
+                cache.put(queries[i][0], queries[i][1], top_k, results[i])
+
+    return results
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find old exams with an LLM.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Always ask the LLM instead of reusing answers from {CACHE_FILE}",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=EMBED_TOP_K,
+        help="Send only the K paths closest to the query by embedding "
+        "(0: send the whole year)",
+    )
+    args = parser.parse_args()
+
     query = input("Search for exam: ")
     year = int(input("Year (1, 2, or 3): "))
-    matches = find_exam(query, year)
+    cache = None if args.no_cache else ResponseCache(CACHE_FILE)
+    try:
+        matches = find_exam(query, year, cache, args.top_k)
+    finally:
+        if cache is not None:
+            cache.close()
 
     print("\nBest match(es):")
     for line in matches.splitlines():
@@ -1,38 +1,128 @@
 #!/usr/bin/env python3
 import argparse
-import json
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
 
+import ijson  # type: ignore[import-untyped]
+import orjson
 
-def simplify_node(node):
-    """Keep only name, path, and children (recursively)."""
-    simplified = {
+from filter_tree import Node, should_skip
+
+
+def simplify_node(node: Dict[str, Any]) -> Node:
+    """Keep only name, path, and children (walking the tree with a stack)."""
+    simplified: Node = {
         "name": node.get("name"),
         "path": node.get("path"),
     }
-    if "children" in node and isinstance(node["children"], list):
-        simplified["children"] = [simplify_node(c) for c in node["children"]]
+
+    # (source node, its simplified copy) pairs still to visit; no recursion limit
+    stack: List[Tuple[Dict[str, Any], Node]] = [(node, simplified)]
+    while stack:
+        src, dst = stack.pop()
+        children = src.get("children")
+        # Not "if not children": files and empty folders must stay distinguishable
+        if children is None:
+            continue
+        dst["children"] = []
+        for child in children:
+            simplified_child: Node = {
+                "name": child.get("name"),
+                "path": child.get("path"),
+            }
+            dst["children"].append(simplified_child)
+            stack.append((child, simplified_child))
+
     return simplified
 
 
-def main():
+def _is_node_prefix(prefix: str) -> bool:
+    # ijson prefixes: "" for the root, "children.item", "children.item.children.item"...
+    return prefix in ("", "children.item") or prefix.endswith(".children.item")
+
+
+def simplify_stream(
+    f: BinaryIO, skip: Optional[Callable[[str], bool]] = None
+) -> Optional[Node]:
+    """Same output as simplify_node, built from ijson events on a binary file.
+
+    Only the name/path/children being kept are ever held in memory; every other
+    field is dropped as it is parsed instead of being materialized first.
+    With a skip predicate, nodes whose name matches are dropped and empty
+    children lists omitted, i.e. filter_tree.filter_node is applied on the fly.
+    """
+    stack: List[Node] = []  # nodes still open, innermost last
+    root: Optional[Node] = None
+    skip_depth = 0  # > 0 while inside a value that is not kept
+    for prefix, event, value in ijson.parse(f):
+        if skip_depth:
+            if event in ("start_map", "start_array"):
+                skip_depth += 1
+            elif event in ("end_map", "end_array"):
+                skip_depth -= 1
+            continue
+        # Key this event belongs to, and the prefix of the map holding that key
+        owner, _, key = prefix.rpartition(".")
+        if event == "start_map":
+            if not _is_node_prefix(prefix):
+                skip_depth = 1
+                continue
+            node: Node = {"name": None, "path": None}
+            if stack:
+                stack[-1]["children"].append(node)
+            stack.append(node)
+        elif event == "end_map":
+            root = stack.pop()
+            if skip is None:
+                continue
+            # The name may come after the children, so decide once the map closes
+            if skip(root["name"] or ""):
+                if stack:
+                    stack[-1]["children"].pop()
+                root = None
+            elif root.get("children") == []:
+                del root["children"]
+        elif event == "start_array":
+            if key == "children" and _is_node_prefix(owner):
+                stack[-1]["children"] = []
+            else:
+                skip_depth = 1
+        elif key == "name" and _is_node_prefix(owner):
+            stack[-1]["name"] = value
+        elif key == "path" and _is_node_prefix(owner):
+            stack[-1]["path"] = value
+    return root
+
+
+def main() -> None:
     parser = argparse.ArgumentParser(
         description="Simplify a Nextcloud tree JSON (keep only name/path/children)."
     )
     parser.add_argument("--infile", default="tree.json", help="Input JSON file")
     parser.add_argument(
-        "--outfile", default="tree_simplified.json", help="Output JSON file"
+        "--outfile",
+        help="Output JSON file (default: tree_filtered.json with --filter, "
+        "tree_simplified.json otherwise)",
+    )
+    parser.add_argument(
+        "--filter",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Also apply filter_tree's rules in the same pass",
     )
     args = parser.parse_args()
+    if args.outfile is None:
+        args.outfile = "tree_filtered.json" if args.filter else "tree_simplified.json"
 
-    with open(args.infile, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    simplified = simplify_node(data)
+    with open(args.infile, "rb") as f:
+        simplified = simplify_stream(f, should_skip if args.filter else None)
 
-    with open(args.outfile, "w", encoding="utf-8") as f:
-        json.dump(simplified, f, ensure_ascii=False, indent=2)
+    with open(args.outfile, "wb") as f:
+        f.write(orjson.dumps(simplified, option=orjson.OPT_INDENT_2))
 
-    print(f"✅ Simplified structure written to {args.outfile}")
+    if args.filter:
+        print(f"✅ Simplified and filtered tree written to {args.outfile}")
+    else:
+        print(f"✅ Simplified structure written to {args.outfile}")
 
 
 if __name__ == "__main__":